@@ -0,0 +1,39 @@
+# arg_types.py
+"""main.py和auto_updater.py共用的argparse参数类型
+
+不依赖pandas、akshare等导入较慢的库，--help和参数错误时可以立即退出。
+"""
+import argparse
+
+
+def positive_int(value: str) -> int:
+    """argparse类型：正整数"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"必须是正整数: {value}")
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"必须是正整数: {value}")
+    return number
+
+
+def positive_float(value: str) -> float:
+    """argparse类型：正数"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"必须是正数: {value}")
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"必须是正数: {value}")
+    return number
+
+
+def non_negative_float(value: str) -> float:
+    """argparse类型：非负数"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"必须是非负数: {value}")
+    if not number >= 0:
+        raise argparse.ArgumentTypeError(f"必须是非负数: {value}")
+    return number
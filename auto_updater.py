@@ -1,10 +1,15 @@
+import asyncio
 import logging
 import time
-import schedule
 import argparse
-from datetime import datetime, timedelta
-from data_fetcher import DataFetcher
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as dt_time, timedelta
+from itertools import repeat
+from typing import List, Optional, Tuple
+from arg_types import positive_int
+from data_fetcher import DataFetcher, TokenBucket
 from database import StockDatabase
+import numpy as np
 import pandas as pd
 
 # 配置日志
@@ -21,111 +26,88 @@ logger = logging.getLogger('auto_updater')
 class StockDataUpdater:
     """股票数据自动更新器"""
     
-    def __init__(self):
-        # 初始化数据库和数据获取器
-        self.db = StockDatabase()
-        self.fetcher = DataFetcher(self.db)
+    def __init__(self, max_workers: int = 16, requests_per_second: float = 5.0, flush_every: int = 100,
+                 parquet_dir: Optional[str] = None):
+        # 初始化数据库和数据获取器，令牌桶容量与并发数一致
+        self.db = StockDatabase(parquet_dir=parquet_dir)
+        self.fetcher = DataFetcher(self.db, rate_limiter=TokenBucket(requests_per_second, capacity=max_workers))
+        # 同时处理的股票数
+        self.max_workers = max_workers
+        # 每处理多少只股票将缓冲的价格数据写入一次数据库
+        self.flush_every = flush_every
     
-    def download_all_stocks_data(self, price_period: str = "all", incremental: bool = False):
+    async def _download_details(self, jobs: List[Tuple[str, str, Optional[str]]], now: datetime) -> Tuple[int, int]:
+        """在新的事件循环中并发下载各股票的价格和概念数据并批量写入数据库
+        
+        Args:
+            jobs: (code, name, period)元组列表，period为None时不获取价格数据（已是最新）
+            now: 本批次统一使用的当前时间
+            
+        Returns:
+            (成功数, 失败数)
+        """
+        # 每只股票同时进行价格和概念两项阻塞请求
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=self.max_workers * 2))
+        return await self.fetcher.download_details(jobs, self.max_workers, flush_every=self.flush_every, now=now)
+    
+    def download_all_stocks_data(self, price_period: str = "all", incremental: bool = False,
+                                 refresh_stock_list: bool = False):
         """下载所有股票的数据
         
+        网络请求在asyncio事件循环中并发执行，数据库写入统一在主线程中完成。
+        
         Args:
             price_period: 价格数据的时间周期，默认为"all"（所有历史数据）
             incremental: 是否使用增量更新模式，默认为False
+            refresh_stock_list: 是否忽略本地缓存，强制从网络重新获取股票列表
         """
         logger.info(f"开始下载所有股票的数据（增量模式: {incremental}）...")
         start_time = time.time()
         
         try:
-            if not incremental:
-                # 非增量模式，调用原有的update_all_data方法
-                self.fetcher.update_all_data(stock_limit=None, price_period=price_period)
+            # 整个批次只取一次当前时间，各股票的日期范围都以此为准
+            now = datetime.now()
+            today_str = now.strftime('%Y%m%d')
+            
+            # 获取股票列表，本地缓存未过期时不访问网络
+            stock_list = self.fetcher.load_stock_list(refresh=refresh_stock_list)
+            if stock_list.empty:
+                logger.warning("未获取到股票列表，无法继续更新")
+                return False
+            
+            # 保存股票基本信息
+            self.db.save_stock_info(stock_list)
+            logger.info(f"已更新 {len(stock_list)} 只股票基本信息")
+            
+            if incremental:
+                # 从刚保存的股票基本信息中一次性查询出每只股票的最新日期
+                stock_list = self.db.get_stocks_with_latest_date()
             else:
-                # 增量模式，先获取股票列表
-                stock_list = self.fetcher.fetch_stock_list()
-                if stock_list.empty:
-                    logger.warning("未获取到股票列表，无法继续更新")
-                    return False
-                
-                # 保存股票基本信息
-                self.db.save_stock_info(stock_list)
-                logger.info(f"已更新 {len(stock_list)} 只股票基本信息")
-                
-                # 获取所有股票的最新日期
-                latest_dates_df = self.db.get_all_stocks_latest_dates()
-                
-                # 创建股票代码到最新日期的映射
-                latest_dates = {row['code']: row['latest_date'] for _, row in latest_dates_df.iterrows()}
-                
-                total_stocks = len(stock_list)
-                success_count = 0
-                failed_count = 0
-                
-                logger.info(f"准备更新 {total_stocks} 只股票的详细数据（增量模式）")
-                
-                for i, (_, row) in enumerate(stock_list.iterrows()):
-                    code = row['code']
-                    name = row.get('name', '未知')
-                    
-                    # 显示进度
-                    progress = (i + 1) / total_stocks * 100
-                    logger.info(f"处理进度: {progress:.1f}% - 正在处理股票 {code}({name}) ({i+1}/{total_stocks})")
-                    
-                    try:
-                        # 确定要获取的日期范围
-                        if code in latest_dates and latest_dates[code]:
-                            # 有历史数据，只获取最新日期之后的数据
-                            latest_date = latest_dates[code]
-                            # 最新日期加一天，确保不重复下载
-                            latest_date_obj = datetime.strptime(latest_date, '%Y-%m-%d')
-                            next_day_obj = latest_date_obj + timedelta(days=1)
-                            next_day_str = next_day_obj.strftime('%Y%m%d')
-                            today_str = datetime.now().strftime('%Y%m%d')
-                            
-                            if next_day_str <= today_str:
-                                # 构建自定义日期范围
-                                custom_period = f"{next_day_str}_{today_str}"
-                                logger.info(f"股票 {code} 已有历史数据，获取 {latest_date} 之后的新数据")
-                                
-                                # 更新价格数据
-                                try:
-                                    prices = self.fetcher.fetch_stock_prices(code, period=custom_period)
-                                    if not prices.empty:
-                                        self.db.save_stock_prices(prices)
-                                        logger.info(f"成功获取并保存股票 {code} 的新数据，共 {len(prices)} 条")
-                                except Exception as e:
-                                    logger.error(f"更新股票 {code} 价格数据失败: {e}")
-                        else:
-                            # 无历史数据，获取全部数据
-                            logger.info(f"股票 {code} 无历史数据，获取全部数据")
-                            try:
-                                prices = self.fetcher.fetch_stock_prices(code, period=price_period)
-                                if not prices.empty:
-                                    self.db.save_stock_prices(prices)
-                            except Exception as e:
-                                logger.error(f"更新股票 {code} 价格数据失败: {e}")
-                        
-                        # 无论是否增量更新，都更新概念数据
-                        try:
-                            concepts = self.fetcher.fetch_stock_concepts(code)
-                            if not concepts.empty:
-                                self.db.save_stock_concepts(concepts)
-                        except Exception as e:
-                            logger.error(f"更新股票 {code} 概念数据失败: {e}")
-                        
-                        success_count += 1
-                        
-                        # 每处理5只股票暂停一下，避免请求过于频繁
-                        if (i + 1) % 5 == 0 and i + 1 < total_stocks:
-                            logger.info("处理频率控制，暂停3秒...")
-                            time.sleep(3)
-                        
-                    except Exception as e:
-                        logger.error(f"处理股票 {code} 时发生错误: {e}")
-                        failed_count += 1
-                        continue
-                    
-                logger.info(f"股票详细数据更新完成 - 成功: {success_count}, 失败: {failed_count}")
+                stock_list = stock_list[['code', 'name']].assign(latest_date=None)
+            
+            # 无历史数据的股票获取全部数据，有历史数据的只获取最新日期之后的数据
+            needs_full = stock_list['latest_date'].isna()
+            full_list = stock_list[needs_full]
+            incr_list = stock_list[~needs_full]
+            
+            # 概念数据在开始并发下载前一次性构建索引，各股票只需在内存中查询；
+            # 构建失败时价格数据照常更新，各股票的概念数据记为获取失败
+            try:
+                self.fetcher.load_concept_index()
+            except Exception as e:
+                logger.error(f"构建概念索引失败，本次不更新概念数据: {e}")
+            
+            # 一次性计算增量股票的日期范围：最新日期加一天到今天，已是最新的股票不获取价格数据
+            next_day = (pd.to_datetime(incr_list['latest_date']) + pd.Timedelta(days=1)).dt.strftime('%Y%m%d')
+            incr_periods = np.where(next_day <= today_str, next_day + '_' + today_str, None)
+            
+            logger.info(f"准备更新 {len(stock_list)} 只股票的详细数据（全量: {len(full_list)}, 增量: {len(incr_list)}）")
+            
+            jobs = list(zip(full_list['code'].to_numpy(), full_list['name'].to_numpy(), repeat(price_period)))
+            jobs += zip(incr_list['code'].to_numpy(), incr_list['name'].to_numpy(), incr_periods)
+            success_count, failed_count = asyncio.run(self._download_details(jobs, now))
+            
+            logger.info(f"股票详细数据更新完成 - 成功: {success_count}, 失败: {failed_count}")
             
             end_time = time.time()
             logger.info(f"所有股票数据下载完成，总耗时: {end_time - start_time:.2f}秒")
@@ -158,27 +140,39 @@ class StockDataUpdater:
     def start_scheduled_updates(self, update_time: str = "09:00"):
         """启动定时自动更新
         
+        每次直接休眠到下一个更新时间点，不再每分钟轮询。
+        
         Args:
             update_time: 每日更新时间，格式为"HH:MM"，默认为"09:00"
         """
         logger.info(f"设置每日自动更新，更新时间: {update_time}")
-        
-        # 安排每日定时任务
-        schedule.every().day.at(update_time).do(self.update_daily_data)
+        run_at = dt_time.fromisoformat(update_time)
         
         logger.info("自动更新服务已启动，按Ctrl+C停止...")
         
         try:
-            # 无限循环，等待任务执行
             while True:
-                schedule.run_pending()
-                time.sleep(60)  # 每分钟检查一次
+                now = datetime.now()
+                next_run = datetime.combine(now.date(), run_at)
+                if next_run <= now:
+                    next_run += timedelta(days=1)
+                logger.info(f"下次更新时间: {next_run:%Y-%m-%d %H:%M:%S}")
+                
+                # 系统休眠等情况可能导致提前醒来，醒来后重新计算剩余时间
+                while (remaining := (next_run - datetime.now()).total_seconds()) > 0:
+                    time.sleep(remaining)
+                
+                self.update_daily_data()
         except KeyboardInterrupt:
             logger.info("自动更新服务已停止")
 
 if __name__ == "__main__":
     # 创建命令行参数解析器
     parser = argparse.ArgumentParser(description='股票数据自动更新工具')
+    parser.add_argument('--workers', type=positive_int, default=16,
+                        help='并发下载股票数据的线程数')
+    parser.add_argument('--parquet-dir', type=str, default=None,
+                        help='Parquet价格存储目录，设置后价格数据同时写入Parquet')
     
     # 添加子命令
     subparsers = parser.add_subparsers(dest='command', help='选择要执行的命令')
@@ -189,6 +183,8 @@ if __name__ == "__main__":
                               help='价格数据的时间周期，可选值: all, 1year, 3year, 5year')
     download_parser.add_argument('--incremental', action='store_true', default=False, 
                               help='使用增量更新模式，只下载最新数据')
+    download_parser.add_argument('--refresh-stock-list', action='store_true', default=False,
+                              help='忽略本地缓存，强制从网络重新获取股票列表')
     
     # 执行每日更新的子命令
     daily_parser = subparsers.add_parser('daily-update', help='执行一次每日更新')
@@ -198,18 +194,31 @@ if __name__ == "__main__":
     schedule_parser.add_argument('--time', type=str, default='09:00', 
                              help='每日更新时间，格式为"HH:MM"')
     
+    # 导出已有价格数据到Parquet的子命令
+    export_parser = subparsers.add_parser('export-parquet', help='将数据库中已有的价格数据导出到--parquet-dir')
+    
+    # 整理数据库文件的子命令
+    vacuum_parser = subparsers.add_parser('vacuum', help='整理数据库文件（一次性迁移页大小等存储设置）')
+    
     # 解析命令行参数
     args = parser.parse_args()
     
     # 创建更新器实例
-    updater = StockDataUpdater()
+    updater = StockDataUpdater(max_workers=args.workers, parquet_dir=args.parquet_dir)
     
     # 根据命令执行相应的操作
     if args.command == 'download-all':
-        updater.download_all_stocks_data(price_period=args.period, incremental=args.incremental)
+        updater.download_all_stocks_data(price_period=args.period, incremental=args.incremental,
+                                         refresh_stock_list=args.refresh_stock_list)
     elif args.command == 'daily-update':
         updater.update_daily_data()
+    elif args.command == 'export-parquet':
+        updater.db.export_prices_to_parquet()
+    elif args.command == 'vacuum':
+        updater.db.vacuum()
     elif args.command == 'start-schedule':
         updater.start_scheduled_updates(update_time=args.time)
     else:
-        parser.print_help()
\ No newline at end of file
+        parser.print_help()
+    
+    updater.db.close()
\ No newline at end of file
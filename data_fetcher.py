@@ -1,12 +1,20 @@
 # data_fetcher.py
+import asyncio
 import akshare as ak
 import pandas as pd
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache, partial, wraps
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 import logging
+import os
+import random
 import time
-from retry import retry
-from database import StockDatabase
+import threading
+from tqdm import tqdm
+from database import PRICE_COLUMNS, STOCK_INFO_COLUMNS, StockDatabase
+from response_cache import ResponseCache
 
 # 配置日志
 logging.basicConfig(
@@ -15,21 +23,168 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 本地缓存目录
+CACHE_DIR = '.cache'
+# 价格和概念成分等网络请求结果的缓存数据库及有效期（秒）
+RESPONSE_CACHE_PATH = os.path.join(CACHE_DIR, 'responses.db')
+PRICE_CACHE_TTL = 24 * 60 * 60
+CONCEPT_CONS_TTL = 7 * 24 * 60 * 60
+# 概念索引构建失败后，至少间隔多少秒才重新尝试，避免每只股票都重复请求失败的接口
+CONCEPT_INDEX_RETRY_INTERVAL = 5 * 60
+# 股票列表的本地缓存文件，当天写入的缓存有效
+STOCK_LIST_CACHE_PATH = os.path.join(CACHE_DIR, 'stock_list.parquet')
+
+
+class TokenBucket:
+    """线程安全的令牌桶限流器
+
+    Args:
+        rate: 每秒补充的令牌数，即允许的平均请求速率
+        capacity: 令牌桶容量，即允许的最大突发请求数
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        # rate为0时计算等待时间会除零，capacity小于1时永远拿不到令牌
+        if not rate > 0:
+            raise ValueError(f"rate必须为正数: {rate}")
+        if capacity < 1:
+            raise ValueError(f"capacity不能小于1: {capacity}")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """获取一个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """从HTTP 429/503错误响应的Retry-After头中解析需要等待的秒数，没有时返回None"""
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) not in (429, 503):
+        return None
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    # Retry-After可以是秒数，也可以是HTTP日期
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_with_backoff(func):
+    """DataFetcher方法的重试装饰器，失败后按指数退避加随机抖动等待再重试
+    
+    重试次数和退避参数取自实例的max_retries、backoff_base和backoff_cap：第n次重试前等待
+    min(backoff_cap, backoff_base * 2**n)再乘以0.5~1.5的随机系数，避免大量请求同时重试；
+    服务端返回429/503并带有Retry-After时按其要求等待，但同样不超过backoff_cap。
+    """
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(self, *args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = _retry_after_seconds(e)
+                if delay is None:
+                    delay = min(self.backoff_cap, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.5)
+                else:
+                    # 服务端给出的等待时间同样不超过退避上限，避免异常的Retry-After让线程长时间挂起
+                    delay = min(delay, self.backoff_cap)
+                logger.warning(f"{func.__name__} 第 {attempt + 1} 次失败，{delay:.1f} 秒后重试: {e}")
+                time.sleep(delay)
+                attempt += 1
+    return wrapper
+
+
+@lru_cache(maxsize=1)
+def _fetch_concept_names(ttl_hash: int) -> pd.DataFrame:
+    """从网络获取全市场概念板块列表，ttl_hash变化时缓存失效；请求失败时不会缓存异常"""
+    logger.info("概念板块列表缓存未命中，从网络获取")
+    return ak.stock_board_concept_name_ths()
+
+
+def get_concept_names() -> pd.DataFrame:
+    """获取全市场概念板块列表
+    
+    该接口与股票代码无关，结果在内存中缓存到当天结束，返回的DataFrame不应被修改。
+    """
+    hits = _fetch_concept_names.cache_info().hits
+    result = _fetch_concept_names(date.today().toordinal())
+    if _fetch_concept_names.cache_info().hits > hits:
+        logger.debug("概念板块列表缓存命中")
+    return result
+
+
+def get_concept_cons(symbol: str, cache: ResponseCache, rate_limiter: Optional[TokenBucket] = None) -> pd.DataFrame:
+    """获取概念板块成分数据，结果缓存CONCEPT_CONS_TTL秒，有效期内重复运行不再访问网络"""
+    def fetch():
+        # 只有实际访问网络时才消耗令牌
+        if rate_limiter:
+            rate_limiter.acquire()
+        return ak.stock_board_concept_cons_ths(symbol=symbol)
+    return cache.get_or_fetch('concept_cons', (symbol,), CONCEPT_CONS_TTL, fetch)
+
 
 class DataFetcher:
-    def __init__(self, db: StockDatabase, max_retries: int = 3, retry_delay: int = 5):
+    def __init__(self, db: StockDatabase, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_cap: float = 30.0, rate_limiter: Optional[TokenBucket] = None,
+                 response_cache: Optional[ResponseCache] = None):
         self.db = db
+        # 网络请求失败后的最大重试次数，以及指数退避的初始等待和最长等待时间（秒）
         self.max_retries = max_retries
-        self.retry_delay = retry_delay
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # 可选的全局限流器，多个线程共享时限制对数据源的总请求速率
+        self.rate_limiter = rate_limiter
+        # 网络请求结果缓存，有效期内重复获取同一数据时直接读取本地缓存
+        self.response_cache = response_cache if response_cache is not None else ResponseCache(RESPONSE_CACHE_PATH)
+        # 股票代码 -> 所属概念列表的倒排索引，首次使用时构建，每天重建一次；
+        # 构建失败时不保存索引，只记录失败时间和异常，间隔CONCEPT_INDEX_RETRY_INTERVAL秒后再重试
+        self._concept_index: Optional[Dict[str, List[str]]] = None
+        self._concept_index_built_on: Optional[date] = None
+        self._concept_index_error: Optional[Exception] = None
+        self._concept_index_failed_at = 0.0
+        self._concept_index_lock = threading.Lock()
 
-    @retry(Exception, tries=3, delay=2, backoff=2)
+    @retry_with_backoff
     def fetch_stock_list(self) -> pd.DataFrame:
         """获取股票列表"""
         try:
             logger.info("开始获取A股股票列表...")
             
-            # 获取A股股票列表
-            stock_list = ak.stock_info_a_code_name()
+            # 三个接口之间没有依赖，并发请求，总耗时取决于最慢的一个
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                stock_list_future = executor.submit(ak.stock_info_a_code_name)
+                # 获取上海证券交易所股票信息
+                sh_future = executor.submit(self._fetch_exchange_info, ak.stock_info_sh_name_code, 'SH', '上海证券交易所')
+                # 获取深圳证券交易所股票信息
+                sz_future = executor.submit(self._fetch_exchange_info, ak.stock_info_sz_name_code, 'SZ', '深圳证券交易所')
+
+                # 获取A股股票列表
+                stock_list = stock_list_future.result()
+                stock_info_sh = sh_future.result()
+                stock_info_sz = sz_future.result()
+
             if stock_list.empty:
                 logger.warning("获取的股票列表为空")
                 return pd.DataFrame()
@@ -37,38 +192,13 @@ class DataFetcher:
             stock_list.columns = ['code', 'name']
             logger.info(f"获取到 {len(stock_list)} 只股票基本信息")
 
-            # 获取上海证券交易所股票信息
-            try:
-                stock_info_sh = ak.stock_info_sh_name_code()
-                if not stock_info_sh.empty and len(stock_info_sh.columns) >= 4:
-                    stock_info_sh = stock_info_sh.iloc[:, [0, 1, 2, 3]]
-                    stock_info_sh.columns = ['code', 'name', 'industry', 'area']
-                    stock_info_sh['market'] = 'SH'
-                else:
-                    stock_info_sh = pd.DataFrame()
-            except Exception as e:
-                logger.warning(f"获取上海证券交易所股票信息失败: {e}")
-                stock_info_sh = pd.DataFrame()
-
-            # 获取深圳证券交易所股票信息
-            try:
-                stock_info_sz = ak.stock_info_sz_name_code()
-                if not stock_info_sz.empty and len(stock_info_sz.columns) >= 4:
-                    stock_info_sz = stock_info_sz.iloc[:, [0, 1, 2, 3]]
-                    stock_info_sz.columns = ['code', 'name', 'industry', 'area']
-                    stock_info_sz['market'] = 'SZ'
-                else:
-                    stock_info_sz = pd.DataFrame()
-            except Exception as e:
-                logger.warning(f"获取深圳证券交易所股票信息失败: {e}")
-                stock_info_sz = pd.DataFrame()
-
             # 合并上海和深圳的股票信息
             stock_info = pd.concat([stock_info_sh, stock_info_sz], ignore_index=True)
             
             # 合并股票列表和详细信息
             if not stock_info.empty:
-                result = pd.merge(stock_list, stock_info, on='code', how='left')
+                # 显式校验一对一关系，交易所数据中出现重复代码时直接报错而不是悄悄产生重复行
+                result = pd.merge(stock_list, stock_info, on='code', how='left', validate='one_to_one')
                 # 处理可能出现的name_x, name_y重复列名问题
                 if 'name_x' in result.columns and 'name_y' in result.columns:
                     result['name'] = result['name_x'].fillna(result['name_y'])
@@ -98,30 +228,82 @@ class DataFetcher:
             logger.error(f"获取股票列表失败: {e}")
             raise
 
-    @retry(Exception, tries=3, delay=2, backoff=2)
-    def fetch_stock_prices(self, code: str, period: str = "1year") -> pd.DataFrame:
-        """获取股票价格数据"""
+    @staticmethod
+    def _fetch_exchange_info(fetch, market: str, exchange_name: str) -> pd.DataFrame:
+        """获取单个交易所的股票信息(code, name, industry, area, market)，失败时返回空DataFrame"""
+        try:
+            stock_info = fetch()
+            if not stock_info.empty and len(stock_info.columns) >= 4:
+                stock_info = stock_info.iloc[:, [0, 1, 2, 3]].set_axis(['code', 'name', 'industry', 'area'], axis=1)
+                return stock_info.assign(market=market)
+        except Exception as e:
+            logger.warning(f"获取{exchange_name}股票信息失败: {e}")
+        return pd.DataFrame()
+
+    def load_stock_list(self, refresh: bool = False) -> pd.DataFrame:
+        """获取股票列表，本地Parquet缓存是当天写入的则直接读取，否则从网络获取并更新缓存
+        
+        按日期而不是按缓存时长判断，每天固定时间运行的定时更新每天都会重新获取一次，新上市的股票当天即可出现。
+        
+        Args:
+            refresh: 为True时忽略本地缓存，强制从网络重新获取
+        """
+        if not refresh and os.path.exists(STOCK_LIST_CACHE_PATH):
+            cached_at = datetime.fromtimestamp(os.path.getmtime(STOCK_LIST_CACHE_PATH))
+            if cached_at.date() == date.today():
+                try:
+                    stock_list = pd.read_parquet(STOCK_LIST_CACHE_PATH)
+                    logger.info(f"从本地缓存加载 {len(stock_list)} 只股票基本信息（缓存于今天 {cached_at:%H:%M:%S}）")
+                    return stock_list
+                except Exception as e:
+                    logger.warning(f"读取股票列表缓存失败，改为从网络获取: {e}")
+
+        stock_list = self.fetch_stock_list()
+        if not stock_list.empty:
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                tmp_path = f"{STOCK_LIST_CACHE_PATH}.tmp"
+                stock_list.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, STOCK_LIST_CACHE_PATH)
+            except Exception as e:
+                logger.warning(f"写入股票列表缓存失败: {e}")
+        return stock_list
+
+    @retry_with_backoff
+    def fetch_stock_prices(self, code: str, period: str = "1year", now: Optional[datetime] = None,
+                           use_cache: bool = True) -> pd.DataFrame:
+        """获取股票价格数据
+        
+        Args:
+            code: 股票代码
+            period: 价格数据的时间周期，或"YYYYMMDD_YYYYMMDD"格式的自定义日期范围
+            now: 计算日期范围所用的当前时间，批量获取时由调用方统一传入，保证同一批次的"今天"一致
+            use_cache: 为False时不读取缓存，总是从网络获取当天最新的数据（结果仍会写入缓存）
+        """
         try:
-            logger.info(f"开始获取股票 {code} 的价格数据，周期: {period}")
+            logger.debug(f"开始获取股票 {code} 的价格数据，周期: {period}")
+            
+            if now is None:
+                now = datetime.now()
             
             # 确定日期范围
             if period == "1year":
-                end_date = datetime.now()
+                end_date = now
                 start_date = end_date - timedelta(days=365)
             elif period == "3year":
-                end_date = datetime.now()
+                end_date = now
                 start_date = end_date - timedelta(days=1095)
             elif period == "5year":
-                end_date = datetime.now()
+                end_date = now
                 start_date = end_date - timedelta(days=1825)
             elif period == "all":
                 # 获取所有历史数据
                 start_date = "19900101"  # A股开市时间
-                end_date = datetime.now()
+                end_date = now
             else:
                 # 自定义日期范围
                 start_date = period.split('_')[0] if '_' in period else "20200101"
-                end_date = period.split('_')[1] if '_' in period else datetime.now().strftime('%Y%m%d')
+                end_date = period.split('_')[1] if '_' in period else now
 
             # 格式化日期字符串
             start_date_str = start_date if isinstance(start_date, str) else start_date.strftime('%Y%m%d')
@@ -129,6 +311,13 @@ class DataFetcher:
 
             logger.debug(f"准备获取股票 {code} 的历史数据: 开始日期={start_date_str}, 结束日期={end_date_str}")
             
+            # 结束日期通常是当天，同一天内重复获取同一日期范围时直接使用缓存
+            cache_key = (code, start_date_str, end_date_str)
+            cached = self.response_cache.get('prices', cache_key, PRICE_CACHE_TTL) if use_cache else None
+            if cached is not None:
+                logger.debug(f"股票 {code} 的价格数据缓存命中")
+                return cached
+            
             # 获取股票历史数据
             try:
                 # 根据测试结果，使用stock_zh_a_daily函数而不是stock_zh_a_hist函数
@@ -150,6 +339,8 @@ class DataFetcher:
                 logger.debug(f"使用带市场标识的股票代码: {market_code}")
                 
                 # 获取完整的日线数据
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
                 stock_daily_df = ak.stock_zh_a_daily(
                     symbol=market_code,  # 使用带市场标识的代码
                     adjust="qfq"  # 前复权
@@ -172,26 +363,12 @@ class DataFetcher:
                     logger.warning(f"在日期范围 {start_date_str} 到 {end_date_str} 内没有找到股票 {code} 的数据")
                     raise ValueError(f"在日期范围内没有找到数据")
                     
-                # 重命名列以匹配原有数据结构
-                filtered_df = filtered_df.rename(columns={
-                    'date': '日期',
-                    'open': '开盘',
-                    'close': '收盘',
-                    'high': '最高',
-                    'low': '最低',
-                    'volume': '成交量',
-                    'amount': '成交额'
-                })
-                
-                # 添加股票代码列
-                filtered_df['股票代码'] = code
-                
-                # 重新排列列顺序以匹配原有数据结构
-                expected_columns = ['日期', '股票代码', '开盘', '收盘', '最高', '最低', '成交量', '成交额']
-                filtered_df = filtered_df.reindex(columns=expected_columns)
-                
-                # 使用过滤后的数据作为返回结果
-                stock_zh_a_hist_df = filtered_df
+                # stock_zh_a_daily返回的列名已与数据库一致，只需补充股票代码、把日期转为sqlite3可接受的字符串，
+                # 再用一次reindex按数据库列顺序整理：缺失的列补NaN，多余的列（如outstanding_share）丢弃
+                stock_zh_a_hist_df = filtered_df.assign(
+                    code=code,
+                    date=filtered_df['date'].dt.strftime('%Y-%m-%d'),
+                ).reindex(columns=PRICE_COLUMNS)
                 
             except Exception as ak_error:
                 # 详细记录akshare调用异常
@@ -201,35 +378,8 @@ class DataFetcher:
                 raise
 
             if not stock_zh_a_hist_df.empty:
-                # 重命名列
-                column_mapping = {
-                    '日期': 'date', '开盘': 'open', '最高': 'high', '最低': 'low',
-                    '收盘': 'close', '成交量': 'volume', '成交额': 'amount',
-                    '涨跌幅': 'pct_change', '换手率': 'turnover_rate'
-                }
-                
-                # 只选择存在的列进行重命名
-                existing_columns = {k: v for k, v in column_mapping.items() if k in stock_zh_a_hist_df.columns}
-                stock_zh_a_hist_df = stock_zh_a_hist_df.rename(columns=existing_columns)
-
-                stock_zh_a_hist_df['code'] = code
-                
-                # 将Timestamp类型的date列转换为字符串格式，以便sqlite3能够接受
-                if 'date' in stock_zh_a_hist_df.columns:
-                    stock_zh_a_hist_df['date'] = stock_zh_a_hist_df['date'].dt.strftime('%Y-%m-%d')
-                
-                # 确保需要的列存在
-                required_columns = ['code', 'date', 'open', 'high', 'low', 'close', 'volume']
-                available_columns = [col for col in required_columns if col in stock_zh_a_hist_df.columns]
-                
-                # 添加缺失的列并设置为None
-                for col in required_columns:
-                    if col not in stock_zh_a_hist_df.columns:
-                        stock_zh_a_hist_df[col] = None
-                
-                stock_zh_a_hist_df = stock_zh_a_hist_df[available_columns + [col for col in ['amount', 'pct_change', 'turnover_rate'] if col in stock_zh_a_hist_df.columns]]
-                
-                logger.info(f"获取到股票 {code} 的 {len(stock_zh_a_hist_df)} 条价格数据")
+                logger.debug(f"获取到股票 {code} 的 {len(stock_zh_a_hist_df)} 条价格数据")
+                self.response_cache.set('prices', cache_key, stock_zh_a_hist_df)
             else:
                 logger.warning(f"未获取到股票 {code} 的价格数据")
 
@@ -240,52 +390,205 @@ class DataFetcher:
             logger.debug(f"异常堆栈:\n{traceback.format_exc()}")
             raise
 
-    @retry(Exception, tries=3, delay=2, backoff=2)
+    def iter_stock_list(self, refresh: bool = False) -> Iterator[tuple]:
+        """逐只股票产出股票基本信息元组，字段顺序与STOCK_INFO_COLUMNS一致
+        
+        调用方可以用itertools.islice只取前若干只股票，而不必先截取整个DataFrame。
+        """
+        stock_list = self.load_stock_list(refresh=refresh)
+        yield from stock_list.reindex(columns=STOCK_INFO_COLUMNS).itertuples(index=False, name=None)
+
+    async def fetch_stock_prices_async(self, code: str, period: str = "1year",
+                                       now: Optional[datetime] = None, use_cache: bool = True) -> pd.DataFrame:
+        """fetch_stock_prices的异步版本
+        
+        akshare只提供阻塞接口，这里将请求放到事件循环的默认线程池中执行，便于用asyncio并发调度。
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(self.fetch_stock_prices, code, period=period, now=now,
+                                                          use_cache=use_cache))
+
+    async def fetch_stock_concepts_async(self, code: str) -> pd.DataFrame:
+        """fetch_stock_concepts的异步版本，首次调用可能需要构建概念索引，同样在线程池中执行"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.fetch_stock_concepts, code)
+
+    async def _fetch_stock_details(self, code: str, name: str, period: Optional[str], now: Optional[datetime],
+                                   use_cache: bool) -> tuple:
+        """下载单只股票的价格数据和概念数据，只下载不保存
+
+        Returns:
+            (是否成功, 价格数据, 概念数据)元组，下载失败或无需下载的部分为None
+        """
+        logger.debug(f"处理股票: {code} - {name}，价格周期: {period}")
+
+        # 价格和概念数据互不依赖，同时下载；一项失败不影响另一项的保存。period为None时价格已是最新，只下载概念
+        requests = [self.fetch_stock_concepts_async(code)]
+        if period:
+            requests.append(self.fetch_stock_prices_async(code, period=period, now=now, use_cache=use_cache))
+        concept_data, *price_result = await asyncio.gather(*requests, return_exceptions=True)
+        price_data = price_result[0] if price_result else None
+
+        success = True
+        if isinstance(price_data, BaseException):
+            logger.error(f"下载股票 {code} - {name} 价格数据失败: {price_data}")
+            price_data = None
+            success = False
+        if isinstance(concept_data, BaseException):
+            logger.error(f"下载股票 {code} - {name} 概念数据失败: {concept_data}")
+            concept_data = None
+            success = False
+        return success, price_data, concept_data
+
+    async def download_details(self, jobs: Iterable[Tuple[str, str, Optional[str]]], concurrency: int,
+                               flush_every: int = 100, now: Optional[datetime] = None,
+                               use_cache: bool = True) -> Tuple[int, int]:
+        """并发下载各股票的价格和概念数据，并批量写入数据库
+
+        网络请求在事件循环的默认线程池中执行，同时处理的股票数由信号量限制，线程池大小由调用方设置。
+        下载结果先缓冲在内存中，每flush_every只股票批量写入一次；写入都在事件循环所在的线程中进行，
+        调用方可以在外面包一层db.bulk_transaction()让整批数据在一个事务中提交。
+
+        Args:
+            jobs: (code, name, period)元组，period为None时不下载价格数据
+            concurrency: 同时处理的股票数
+            flush_every: 每处理多少只股票写入一次数据库
+            now: 计算日期范围所用的当前时间，整批股票统一使用，跨越午夜运行时各股票的日期范围仍保持一致
+            use_cache: 为False时不读取价格缓存
+
+        Returns:
+            (成功数, 失败数)
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(code, name, period):
+            async with semaphore:
+                return await self._fetch_stock_details(code, name, period, now, use_cache)
+
+        tasks = [asyncio.create_task(bounded(code, name, period)) for code, name, period in jobs]
+        success_count = 0
+        fail_count = 0
+        price_buffer = []
+        concept_buffer = []
+
+        def flush_buffers():
+            for kind, buffer, save in (("价格", price_buffer, self.db.save_stock_prices_batch),
+                                       ("概念", concept_buffer, self.db.save_stock_concepts_batch)):
+                try:
+                    save(buffer)
+                except Exception as e:
+                    logger.error(f"批量保存 {len(buffer)} 只股票的{kind}数据失败: {e}")
+                buffer.clear()
+
+        # 进度条至少间隔0.5秒、每完成约0.5%的股票才刷新一次，避免高并发时频繁写终端
+        with tqdm(total=len(tasks), desc="处理股票数据", mininterval=0.5,
+                  miniters=max(1, len(tasks) // 200)) as progress:
+            for i, task in enumerate(asyncio.as_completed(tasks)):
+                success, price_data, concept_data = await task
+                progress.update(1)
+                if success:
+                    success_count += 1
+                else:
+                    fail_count += 1
+
+                if price_data is not None and not price_data.empty:
+                    price_buffer.append(price_data)
+                if concept_data is not None and not concept_data.empty:
+                    concept_buffer.append(concept_data)
+
+                if (i + 1) % flush_every == 0:
+                    flush_buffers()
+
+        flush_buffers()
+        return success_count, fail_count
+
+    def load_concept_index(self) -> Dict[str, List[str]]:
+        """获取股票代码到所属概念的倒排索引
+        
+        索引在首次调用时构建，当天内直接复用，跨天后重建；多线程并发调用时只会构建一次。
+        构建失败时抛出异常，不会把不完整的索引保存下来；CONCEPT_INDEX_RETRY_INTERVAL秒内再次调用直接抛出上次的异常。
+        """
+        with self._concept_index_lock:
+            if self._concept_index is not None and self._concept_index_built_on == date.today():
+                return self._concept_index
+            if (self._concept_index_error is not None
+                    and time.time() - self._concept_index_failed_at < CONCEPT_INDEX_RETRY_INTERVAL):
+                raise self._concept_index_error
+            
+            today = date.today()
+            try:
+                index = self._build_concept_index()
+            except Exception as e:
+                self._concept_index_error = e
+                self._concept_index_failed_at = time.time()
+                raise
+            self._concept_index = index
+            self._concept_index_built_on = today
+            self._concept_index_error = None
+            return index
+
+    @retry_with_backoff
+    def _fetch_concept_names(self) -> pd.DataFrame:
+        """获取全市场概念板块列表，失败时按退避策略重试"""
+        return get_concept_names()
+
+    @retry_with_backoff
+    def _fetch_concept_cons(self, concept: str) -> pd.DataFrame:
+        """获取单个概念板块的成分股，失败时按退避策略重试"""
+        return get_concept_cons(concept, self.response_cache, self.rate_limiter)
+
+    def _build_concept_index(self) -> Dict[str, List[str]]:
+        """获取全市场概念板块及其成分股，构建股票代码到概念的倒排索引
+        
+        每个请求失败后都会先按退避策略重试；重试用尽后概念列表或任一概念的成分股仍获取失败时抛出异常，
+        不返回缺少部分概念的索引。
+        """
+        logger.info("开始构建概念板块索引...")
+        try:
+            concept_names = self._fetch_concept_names()
+        except Exception as e:
+            logger.error(f"获取概念板块列表失败: {e}")
+            raise
+
+        # 根据不同的返回格式提取概念名称
+        name_column = next((col for col in ('name', '概念名称', 'concept_name', '板块名称')
+                            if col in concept_names.columns), None)
+        if name_column is None:
+            raise ValueError(f"无法识别概念板块列表的格式: {list(concept_names.columns)}")
+
+        index: Dict[str, List[str]] = {}
+        concepts = concept_names[name_column].dropna().unique()
+        for concept in concepts:
+            try:
+                members = self._fetch_concept_cons(concept)
+            except Exception as e:
+                logger.error(f"获取概念 {concept} 的成分股失败，本次不构建概念索引: {e}")
+                raise
+            if '代码' not in members.columns:
+                raise ValueError(f"无法识别概念 {concept} 的成分股格式: {list(members.columns)}")
+            for code in members['代码'].astype(str):
+                index.setdefault(code, []).append(concept)
+
+        logger.info(f"概念板块索引构建完成: {len(concepts)} 个概念，覆盖 {len(index)} 只股票")
+        return index
+
     def fetch_stock_concepts(self, code: str) -> pd.DataFrame:
-        """获取股票概念板块数据"""
+        """获取股票概念板块数据，从概念倒排索引中查询，索引构建完成后不再访问网络"""
         try:
-            logger.info(f"开始获取股票 {code} 的概念板块数据")
+            logger.debug(f"开始获取股票 {code} 的概念板块数据")
             
-            # 尝试多种方式获取股票概念
-            concept_methods = [
-                lambda: ak.stock_board_concept_name_ths(),
-                lambda: ak.stock_board_concept_cons_ths(symbol=code),
-                lambda: ak.stock_board_concept_name_ths()
-            ]
+            concepts = self.load_concept_index().get(code, [])
             
-            concepts = []
-            concept_df = pd.DataFrame()
+            # 按索引中的顺序去重并限制数量，保证每次选出的概念一致
+            concepts = pd.Series(concepts, dtype=object).unique()[:10].tolist()  # 最多保留10个概念
             
-            for method in concept_methods:
-                try:
-                    temp_df = method()
-                    if not temp_df.empty:
-                        concept_df = temp_df
-                        break
-                except Exception as inner_e:
-                    logger.debug(f"尝试一种概念获取方法失败: {inner_e}")
-                    continue
-            
-            # 提取概念信息
-            if not concept_df.empty:
-                # 根据不同的返回格式提取概念
-                if '概念名称' in concept_df.columns:
-                    concepts = concept_df['概念名称'].tolist()
-                elif 'concept_name' in concept_df.columns:
-                    concepts = concept_df['concept_name'].tolist()
-                elif '板块名称' in concept_df.columns:
-                    concepts = concept_df['板块名称'].tolist()
-                
-                # 去重并限制数量
-                concepts = list(set(concepts))[:10]  # 最多保留10个概念
-                
-                if concepts:
-                    result = pd.DataFrame({
-                        'code': [code] * len(concepts),
-                        'concept': concepts
-                    })
-                    logger.info(f"获取到股票 {code} 的 {len(concepts)} 个概念")
-                    return result
+            if concepts:
+                result = pd.DataFrame({
+                    'code': [code] * len(concepts),
+                    'concept': concepts
+                })
+                logger.debug(f"获取到股票 {code} 的 {len(concepts)} 个概念")
+                return result
             
             logger.warning(f"未获取到股票 {code} 的概念数据")
             return pd.DataFrame()
@@ -322,9 +625,9 @@ class DataFetcher:
             success_count = 0
             failed_count = 0
             
-            for i, (_, row) in enumerate(stocks_to_process.iterrows()):
-                code = row['code']
-                name = row.get('name', '未知')
+            codes = stocks_to_process['code'].to_numpy()
+            names = stocks_to_process['name'].to_numpy()
+            for i, (code, name) in enumerate(zip(codes, names)):
                 
                 # 显示进度
                 progress = (i + 1) / total_stocks * 100
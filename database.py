@@ -1,30 +1,168 @@
 # database.py
+import hashlib
+import json
 import sqlite3
 import pandas as pd
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 import logging
+import threading
 from contextlib import contextmanager
 
+# 数据库页大小，较大的页更适合按股票顺序批量读取价格数据
+PAGE_SIZE = 8192
+
+# stock_info表中由程序写入的列，顺序与INSERT语句一致
+STOCK_INFO_COLUMNS = ['code', 'name', 'industry', 'area', 'market', 'list_date']
+
+# 按代码写入股票基本信息，已存在的股票原地更新并刷新更新时间
+UPSERT_STOCK_INFO_SQL = (
+    f"INSERT INTO stock_info ({', '.join(STOCK_INFO_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * len(STOCK_INFO_COLUMNS))}) "
+    f"ON CONFLICT(code) DO UPDATE SET "
+    + ', '.join(f"{col}=excluded.{col}" for col in STOCK_INFO_COLUMNS[1:])
+    + ", updated_at=CURRENT_TIMESTAMP"
+)
+
+# stock_prices表中由程序写入的列，顺序与INSERT语句一致
+PRICE_COLUMNS = ['code', 'date', 'open', 'high', 'low', 'close', 'volume', 'amount']
+
+# 按(code, date)主键写入价格数据，已存在的行原地更新而不是先删除再插入
+UPSERT_PRICE_SQL = (
+    f"INSERT INTO stock_prices ({', '.join(PRICE_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * len(PRICE_COLUMNS))}) "
+    f"ON CONFLICT(code, date) DO UPDATE SET "
+    + ', '.join(f"{col}=excluded.{col}" for col in PRICE_COLUMNS[2:])
+)
+
+# 价格表以(code, date)为主键的WITHOUT ROWID表，数据直接按主键聚簇存储
+CREATE_STOCK_PRICES_SQL = '''
+    CREATE TABLE IF NOT EXISTS stock_prices (
+        code TEXT,
+        date TEXT,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume REAL,
+        amount REAL,
+        PRIMARY KEY (code, date)
+    ) WITHOUT ROWID
+'''
+
+# 按代码写入概念指纹，已存在的代码原地更新
+UPSERT_CONCEPT_DIGEST_SQL = (
+    "INSERT INTO stock_concepts_digest (code, digest) VALUES (?, ?) "
+    "ON CONFLICT(code) DO UPDATE SET digest=excluded.digest, updated_at=CURRENT_TIMESTAMP"
+)
+
+
+def _concepts_digest(concepts) -> str:
+    """计算一只股票概念集合的指纹，与概念的顺序和重复无关"""
+    return hashlib.blake2b(','.join(sorted(set(concepts))).encode(), digest_size=8).hexdigest()
+
 
 class StockDatabase:
-    def __init__(self, db_path: str = "stock_data.db"):
+    def __init__(self, db_path: str = "stock_data.db", parquet_dir: Optional[str] = None):
+        """
+        Args:
+            db_path: SQLite数据库文件路径
+            parquet_dir: Parquet价格存储目录；设置后价格数据同时写入Parquet，get_stock_prices改为从Parquet读取，
+                SQLite中的价格表仍保留，用于增量更新时查询各股票的最新日期
+        """
         self.db_path = db_path
+        # sqlite3连接不能跨线程共享，每个线程各自持有一个长连接并在多次调用间复用
+        self._local = threading.local()
+        # 同一时刻只允许一个线程写入，多个线程并发保存时在进程内排队，而不是争抢SQLite的写锁后报database is locked；
+        # 可重入，bulk_transaction()中的各次保存会再次获取
+        self._write_lock = threading.RLock()
+        self.parquet_store = None
+        if parquet_dir:
+            # parquet_store依赖本模块中的列定义，在这里导入以避免循环导入
+            from parquet_store import ParquetStore
+            self.parquet_store = ParquetStore(parquet_dir)
         self.init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建新的数据库连接并设置连接级别的PRAGMA"""
+        # 写锁被其他连接（如另一个进程）占用时最多等待30秒，而不是立即报错
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        # 以下PRAGMA只对当前连接生效，需要在每次连接时设置
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-100000")
+        # 使用内存映射读取数据库文件，减少分析查询时的read系统调用和内存拷贝
+        conn.execute("PRAGMA mmap_size=268435456")
+        return conn
         
     @contextmanager
     def get_connection(self):
-        """获取数据库连接的上下文管理器"""
+        """获取当前线程数据库连接的上下文管理器
+        
+        连接在首次使用时创建，退出时不关闭，由close()统一关闭；
+        退出时如果还有未提交的事务（通常是操作中途出错），会将其回滚，避免影响后续操作。
+        """
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = self._connect()
             yield conn
         except sqlite3.Error as e:
             logging.error(f"数据库连接错误: {e}")
             raise
         finally:
-            if conn:
-                conn.close()
+            # bulk_transaction()期间的外层事务由其自身负责提交或回滚
+            if conn is not None and conn.in_transaction and not getattr(self._local, 'bulk', False):
+                conn.rollback()
+                # 缓存中可能有本次事务中新插入的概念id，回滚后一并作废
+                self._local.concept_ids = None
+
+    @contextmanager
+    def bulk_transaction(self):
+        """在一个事务中执行多次保存操作的上下文管理器
+        
+        期间各保存方法不再各自提交，而是在外层事务的保存点中执行，某次保存出错只撤销该次保存；
+        退出时统一提交一次，整个代码块抛出异常时整体回滚。只对当前线程的连接生效。
+        """
+        with self._write_lock, self.get_connection() as conn:
+            conn.execute("BEGIN")
+            self._local.bulk = True
+            try:
+                yield conn
+            finally:
+                self._local.bulk = False
+            conn.commit()
+
+    @contextmanager
+    def _write_transaction(self):
+        """保存方法使用的写事务，正常退出时提交
+        
+        在bulk_transaction()中时改为使用保存点，由外层事务统一提交。
+        """
+        with self._write_lock, self.get_connection() as conn:
+            if not getattr(self._local, 'bulk', False):
+                conn.execute("BEGIN")
+                yield conn
+                conn.commit()
+                return
+            
+            conn.execute("SAVEPOINT bulk_save")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK TO bulk_save")
+                self._local.concept_ids = None
+                raise
+            finally:
+                conn.execute("RELEASE bulk_save")
+
+    def close(self):
+        """关闭当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
 
     def init_database(self):
         """初始化数据库表结构"""
@@ -32,6 +170,11 @@ class StockDatabase:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
 
+                # 页大小只对新建的数据库生效，且必须在切换到WAL之前设置；已有数据库需通过vacuum()迁移
+                cursor.execute(f"PRAGMA page_size={PAGE_SIZE}")
+                # WAL模式会持久化到数据库文件中，批量写入时避免每次提交都同步回滚日志
+                cursor.execute("PRAGMA journal_mode=WAL")
+
                 # 股票基本信息表
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS stock_info (
@@ -45,28 +188,49 @@ class StockDatabase:
                     )
                 ''')
 
-                # 股票价格数据表
+                # 股票价格数据表，旧版本使用自增id+唯一索引，先迁移到复合主键
+                # (code, date)主键本身就是按代码、日期排序的聚簇索引，按代码查询最新日期无需额外索引
+                self._migrate_stock_prices(conn)
+                cursor.execute(CREATE_STOCK_PRICES_SQL)
+
+                # 概念维度表，每个概念名称只保存一次
                 cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS stock_prices (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        code TEXT,
-                        date TEXT,
-                        open REAL,
-                        high REAL,
-                        low REAL,
-                        close REAL,
-                        volume REAL,
-                        amount REAL,
-                        UNIQUE(code, date)
+                    CREATE TABLE IF NOT EXISTS concepts (
+                        id INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL UNIQUE
                     )
                 ''')
 
-                # 板块概念表
+                # 股票与概念的对应关系表，以(code, concept_id)为主键，重复的对应关系由INSERT OR IGNORE跳过
                 cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS stock_concepts (
+                    CREATE TABLE IF NOT EXISTS stock_concept_map (
                         code TEXT,
-                        concept TEXT,
-                        PRIMARY KEY (code, concept)
+                        concept_id INTEGER REFERENCES concepts (id),
+                        PRIMARY KEY (code, concept_id)
+                    ) WITHOUT ROWID
+                ''')
+
+                # 板块概念视图，保持原stock_concepts表(code, concept)的查询方式；旧版本的同名表先迁移
+                self._migrate_stock_concepts(conn)
+                cursor.execute('''
+                    CREATE VIEW IF NOT EXISTS stock_concepts AS
+                    SELECT m.code, c.name AS concept
+                    FROM stock_concept_map m JOIN concepts c ON c.id = m.concept_id
+                ''')
+
+                # 已写入SQLite但尚未成功写入Parquet的股票，增量更新时按无数据处理，重新下载全部价格数据
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS parquet_pending (
+                        code TEXT PRIMARY KEY
+                    )
+                ''')
+
+                # 概念指纹表，记录每只股票当前概念集合的指纹，概念未变化时跳过写入
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS stock_concepts_digest (
+                        code TEXT PRIMARY KEY,
+                        digest TEXT,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     )
                 ''')
 
@@ -100,17 +264,74 @@ class StockDatabase:
             logging.error(f"数据库初始化失败: {e}")
             raise
 
-    def save_stock_info(self, stock_data: pd.DataFrame):
-        """保存股票基本信息"""
+    def vacuum(self):
+        """整理数据库文件，并将已有数据库迁移到PAGE_SIZE页大小
+        
+        WAL模式下无法修改页大小，需要先切换回回滚日志模式再VACUUM，完成后恢复WAL。
+        VACUUM会重写整个数据库文件，这是一次性的迁移操作，执行期间不能有其他进程访问数据库。
+        """
         try:
             with self.get_connection() as conn:
-                # 先清空表，再插入数据，保持replace的行为
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM stock_info")
-                conn.commit()
+                logging.info("开始整理数据库文件...")
+                conn.execute("PRAGMA journal_mode=DELETE")
+                conn.execute(f"PRAGMA page_size={PAGE_SIZE}")
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA journal_mode=WAL")
+                logging.info("数据库文件整理完成")
+        except sqlite3.Error as e:
+            logging.error(f"整理数据库文件失败: {e}")
+            raise
+
+    def _migrate_stock_prices(self, conn: sqlite3.Connection):
+        """将旧版stock_prices表(自增id + UNIQUE(code, date))迁移为以(code, date)为主键的WITHOUT ROWID表，
+        省去额外的唯一索引B树"""
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(stock_prices)")]
+        if 'id' not in columns:
+            return
+
+        logging.info("正在将stock_prices表迁移为(code, date)复合主键...")
+        column_list = ', '.join(PRICE_COLUMNS)
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        cursor.execute("ALTER TABLE stock_prices RENAME TO stock_prices_legacy")
+        cursor.execute(CREATE_STOCK_PRICES_SQL)
+        cursor.execute(f"INSERT INTO stock_prices ({column_list}) "
+                       f"SELECT {column_list} FROM stock_prices_legacy ORDER BY code, date")
+        cursor.execute("DROP TABLE stock_prices_legacy")
+        conn.commit()
+        logging.info("stock_prices表迁移完成")
+
+    def _migrate_stock_concepts(self, conn: sqlite3.Connection):
+        """将旧版stock_concepts表(code, concept)拆分为concepts维度表和stock_concept_map对应关系表"""
+        table_type = conn.execute("SELECT type FROM sqlite_master WHERE name = 'stock_concepts'").fetchone()
+        if table_type is None or table_type[0] != 'table':
+            return
+
+        logging.info("正在将stock_concepts表迁移为概念维度表和对应关系表...")
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        cursor.execute("INSERT OR IGNORE INTO concepts (name) SELECT DISTINCT concept FROM stock_concepts")
+        cursor.execute("INSERT OR IGNORE INTO stock_concept_map (code, concept_id) "
+                       "SELECT sc.code, c.id FROM stock_concepts sc JOIN concepts c ON c.name = sc.concept "
+                       "ORDER BY sc.code")
+        cursor.execute("DROP TABLE stock_concepts")
+        conn.commit()
+        logging.info("stock_concepts表迁移完成")
+
+    def save_stock_info(self, stock_data: pd.DataFrame):
+        """保存股票基本信息
+        
+        在一个事务中按代码更新或插入股票信息，并删除不在本次列表中的股票，保持整表替换的行为，
+        且其他连接不会读到中间状态的空表。
+        """
+        try:
+            with self._write_transaction() as conn:
+                data_tuples = stock_data.reindex(columns=STOCK_INFO_COLUMNS).itertuples(index=False, name=None)
+                codes = json.dumps(stock_data['code'].tolist())
                 
-                # 插入新数据
-                stock_data.to_sql('stock_info', conn, if_exists='append', index=False)
+                cursor = conn.cursor()
+                cursor.executemany(UPSERT_STOCK_INFO_SQL, data_tuples)
+                cursor.execute("DELETE FROM stock_info WHERE code NOT IN (SELECT value FROM json_each(?))", (codes,))
                 logging.info(f"已保存 {len(stock_data)} 条股票基本信息")
         except (sqlite3.Error, pd.io.sql.DatabaseError) as e:
             logging.error(f"保存股票基本信息失败: {e}")
@@ -118,41 +339,147 @@ class StockDatabase:
 
     def save_stock_prices(self, price_data: pd.DataFrame):
         """保存股票价格数据"""
+        self.save_stock_prices_batch([price_data])
+
+    def save_stock_prices_batch(self, price_frames: List[pd.DataFrame]):
+        """在单个事务中批量保存多只股票的价格数据
+        
+        Args:
+            price_frames: 价格数据DataFrame列表，每个DataFrame需包含PRICE_COLUMNS中的列
+        """
+        price_frames = [df for df in price_frames if not df.empty]
+        if not price_frames:
+            return
+        
         try:
-            with self.get_connection() as conn:
-                # 处理重复数据的问题
-                conn.execute("PRAGMA foreign_keys = ON")
-                
-                # 使用executemany批量插入，提高效率并处理重复键
-                if not price_data.empty:
-                    # 准备数据
-                    data_tuples = [tuple(x) for x in price_data.to_numpy()]
-                    columns = ', '.join(['code', 'date', 'open', 'high', 'low', 'close', 'volume', 'amount'])
-                    placeholders = ', '.join(['?' for _ in range(len(price_data.columns))])
-                    
-                    # 使用INSERT OR REPLACE来处理重复数据
-                    query = f"INSERT OR REPLACE INTO stock_prices ({columns}) VALUES ({placeholders})"
-                    
-                    cursor = conn.cursor()
-                    cursor.executemany(query, data_tuples)
-                    conn.commit()
-                    logging.info(f"已保存 {len(price_data)} 条股票价格数据")
+            # 价格表按(code, date)主键聚簇存储，没有可以推迟重建的二级索引；
+            # 按主键顺序插入时新行总是落在B树中相邻的位置，减少页分裂和随机写
+            price_data = pd.concat([df[PRICE_COLUMNS] for df in price_frames], ignore_index=True)
+            price_data = price_data.sort_values(['code', 'date'], ignore_index=True)
+            
+            with self._write_transaction() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(UPSERT_PRICE_SQL, price_data.itertuples(index=False, name=None))
+                if self.parquet_store is not None:
+                    # 与价格数据在同一事务中标记待同步，Parquet写入成功后才清除
+                    cursor.executemany("INSERT OR IGNORE INTO parquet_pending (code) VALUES (?)",
+                                       ((code,) for code in price_data['code'].unique()))
+                logging.info(f"已保存 {len(price_data)} 条股票价格数据")
         except (sqlite3.Error, pd.io.sql.DatabaseError) as e:
             logging.error(f"保存股票价格数据失败: {e}")
             raise
+        
+        if self.parquet_store is not None:
+            self._mirror_to_parquet(price_data)
+
+    def _mirror_to_parquet(self, price_data: pd.DataFrame):
+        """将已写入SQLite的价格数据写入Parquet，成功后清除这些股票的待同步标记
+        
+        写入失败时只记录错误并保留标记：SQLite中的数据已经保存，标记的股票在下次增量更新时会重新下载全部价格数据，
+        补齐Parquet中缺失的部分。
+        
+        在bulk_transaction()中时每批数据在自己的保存点释放后立即写入，不必把整轮下载的数据留在内存中等待最终提交；
+        如果外层事务最终回滚，Parquet只会比SQLite多出这些数据，SQLite中的最新日期仍是旧的，
+        下次增量更新会重新下载并覆盖这些日期，而标记的增删也随外层事务一起回滚。
+        """
+        codes = price_data['code'].unique().tolist()
+        # 持有写锁，避免其他线程在写入Parquet期间重新标记同一股票后被这里清除
+        with self._write_lock:
+            try:
+                self.parquet_store.save_prices(price_data)
+            except Exception as e:
+                logging.error(f"价格数据写入Parquet失败，{len(codes)} 只股票将在下次更新时重新下载: {e}")
+                return
+            with self._write_transaction() as conn:
+                conn.execute("DELETE FROM parquet_pending WHERE code IN (SELECT value FROM json_each(?))",
+                             (json.dumps(codes),))
+
+    def export_prices_to_parquet(self, chunksize: int = 500000):
+        """将SQLite中已有的价格数据一次性导出到Parquet存储
+        
+        在已有数据的数据库上首次启用Parquet存储时使用，之后的写入会自动同步到Parquet。
+        """
+        if self.parquet_store is None:
+            raise ValueError("未配置Parquet存储目录")
+
+        try:
+            with self.get_connection() as conn:
+                query = f"SELECT {', '.join(PRICE_COLUMNS)} FROM stock_prices ORDER BY code, date"
+                total = 0
+                for chunk in pd.read_sql_query(query, conn, chunksize=chunksize):
+                    self.parquet_store.save_prices(chunk)
+                    total += len(chunk)
+                logging.info(f"已导出 {total} 条价格数据到Parquet存储")
+        except (sqlite3.Error, pd.io.sql.DatabaseError) as e:
+            logging.error(f"导出价格数据到Parquet失败: {e}")
+            raise
 
     def save_stock_concepts(self, concept_data: pd.DataFrame):
         """保存股票概念板块数据"""
+        self.save_stock_concepts_batch([concept_data])
+
+    def save_stock_concepts_batch(self, concept_frames: List[pd.DataFrame]):
+        """在单个事务中批量保存多只股票的概念板块数据
+        
+        每只股票的概念集合与上次保存时的指纹比较，未变化的股票只刷新指纹的更新时间；
+        变化了的股票只追加新的概念关联，已保存的关联不会删除。
+        
+        Args:
+            concept_frames: 概念数据DataFrame列表，每个DataFrame需包含code和concept两列
+        """
+        concept_frames = [df for df in concept_frames if not df.empty]
+        if not concept_frames:
+            return
+        
         try:
-            with self.get_connection() as conn:
-                if not concept_data.empty:
-                    # 使用INSERT OR REPLACE来处理重复数据
-                    concept_data.to_sql('stock_concepts', conn, if_exists='append', index=False, method='multi')
-                    logging.info(f"已保存 {len(concept_data)} 条股票概念数据")
+            concept_data = pd.concat([df[['code', 'concept']] for df in concept_frames], ignore_index=True)
+            digests = {code: _concepts_digest(concepts)
+                       for code, concepts in concept_data.groupby('code', sort=False)['concept']}
+            
+            with self._write_transaction() as conn:
+                cursor = conn.cursor()
+                
+                # 一次查询出本批股票已保存的指纹
+                stored = dict(cursor.execute(
+                    "SELECT code, digest FROM stock_concepts_digest WHERE code IN (SELECT value FROM json_each(?))",
+                    (json.dumps(list(digests)),),
+                ))
+                unchanged = [code for code, digest in digests.items() if stored.get(code) == digest]
+                changed = [code for code, digest in digests.items() if stored.get(code) != digest]
+                
+                cursor.executemany("UPDATE stock_concepts_digest SET updated_at = CURRENT_TIMESTAMP WHERE code = ?",
+                                   ((code,) for code in unchanged))
+                if changed:
+                    changed_rows = concept_data[concept_data['code'].isin(changed)]
+                    concept_ids = self._get_concept_ids(conn, changed_rows['concept'].unique().tolist())
+                    # 已保存的(code, concept_id)以及同一只股票重复出现的概念由INSERT OR IGNORE跳过
+                    cursor.executemany("INSERT OR IGNORE INTO stock_concept_map (code, concept_id) VALUES (?, ?)",
+                                       ((code, concept_ids[concept])
+                                        for code, concept in changed_rows.itertuples(index=False, name=None)))
+                    cursor.executemany(UPSERT_CONCEPT_DIGEST_SQL, ((code, digests[code]) for code in changed))
+                logging.info(f"已保存 {len(changed)} 只股票的概念数据，{len(unchanged)} 只股票概念未变化已跳过")
         except (sqlite3.Error, pd.io.sql.DatabaseError) as e:
             logging.error(f"保存股票概念数据失败: {e}")
             raise
 
+    def _get_concept_ids(self, conn: sqlite3.Connection, names: List[str]) -> Dict[str, int]:
+        """在当前事务中查询概念id，不存在的概念先插入concepts表
+        
+        已知的概念id缓存在当前线程的内存中，大量股票共享的概念只需写入和查询一次。
+        """
+        concept_ids = getattr(self._local, 'concept_ids', None)
+        if concept_ids is None:
+            concept_ids = self._local.concept_ids = {}
+        
+        new_names = [name for name in dict.fromkeys(names) if name not in concept_ids]
+        if new_names:
+            conn.executemany("INSERT OR IGNORE INTO concepts (name) VALUES (?)", ((name,) for name in new_names))
+            concept_ids.update(conn.execute(
+                "SELECT name, id FROM concepts WHERE name IN (SELECT value FROM json_each(?))",
+                (json.dumps(new_names, ensure_ascii=False),),
+            ))
+        return {name: concept_ids[name] for name in names}
+
     def get_stock_info(self, code: Optional[str] = None) -> pd.DataFrame:
         """获取股票基本信息"""
         try:
@@ -169,7 +496,10 @@ class StockDatabase:
             return pd.DataFrame()
 
     def get_stock_prices(self, code: str, start_date: str = None, end_date: str = None) -> pd.DataFrame:
-        """获取股票价格数据"""
+        """获取股票价格数据，启用Parquet存储时从Parquet读取"""
+        if self.parquet_store is not None:
+            return self.parquet_store.get_prices(code, start_date, end_date)
+
         try:
             with self.get_connection() as conn:
                 query = "SELECT * FROM stock_prices WHERE code = ?"
@@ -207,13 +537,12 @@ class StockDatabase:
     def save_training_record(self, model_name: str, metrics: Dict, parameters: Dict, score: float):
         """保存模型训练记录"""
         try:
-            with self.get_connection() as conn:
+            with self._write_transaction() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO model_training_records (model_name, training_date, metrics, parameters, performance_score)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (model_name, datetime.now(), str(metrics), str(parameters), score))
-                conn.commit()
                 logging.info(f"已保存模型训练记录: {model_name}")
         except sqlite3.Error as e:
             logging.error(f"保存模型训练记录失败: {e}")
@@ -222,18 +551,23 @@ class StockDatabase:
     def save_user_feedback(self, feedback_type: str, content: str, related_stock: str = None, rating: int = None):
         """保存用户反馈"""
         try:
-            with self.get_connection() as conn:
+            with self._write_transaction() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO user_feedback (feedback_type, content, related_stock, rating)
                     VALUES (?, ?, ?, ?)
                 ''', (feedback_type, content, related_stock, rating))
-                conn.commit()
                 logging.info(f"已保存用户反馈: {feedback_type}")
         except sqlite3.Error as e:
             logging.error(f"保存用户反馈失败: {e}")
             raise
     
+    def _pending_condition(self, code_expr: str) -> str:
+        """股票是否有尚未同步到Parquet的价格数据的SQL条件；未启用Parquet时SQLite即是读取来源，条件恒为假"""
+        if self.parquet_store is None:
+            return "0"
+        return f"EXISTS (SELECT 1 FROM parquet_pending pp WHERE pp.code = {code_expr})"
+
     def get_latest_stock_date(self, code: str) -> Optional[str]:
         """获取指定股票的最新数据日期
         
@@ -245,9 +579,10 @@ class StockDatabase:
         """
         try:
             with self.get_connection() as conn:
-                query = "SELECT MAX(date) FROM stock_prices WHERE code = ?"
+                query = f"SELECT CASE WHEN {self._pending_condition(':code')} THEN NULL " \
+                        f"ELSE (SELECT MAX(date) FROM stock_prices WHERE code = :code) END"
                 cursor = conn.cursor()
-                cursor.execute(query, (code,))
+                cursor.execute(query, {'code': code})
                 result = cursor.fetchone()[0]
                 return result
         except (sqlite3.Error, pd.io.sql.DatabaseError) as e:
@@ -257,18 +592,52 @@ class StockDatabase:
     def get_all_stocks_latest_dates(self) -> pd.DataFrame:
         """获取所有股票的最新数据日期
         
+        GROUP BY code会扫描整张价格表，这里用递归CTE沿(code, date)主键逐个跳到下一个股票代码，
+        每只股票只需两次主键查找，耗时与股票数量而不是价格行数成正比。
+        
         Returns:
-            DataFrame，包含code和latest_date两列
+            DataFrame，包含code和latest_date两列；尚有数据未同步到Parquet的股票不在结果中
         """
         try:
             with self.get_connection() as conn:
-                query = """
-                    SELECT code, MAX(date) as latest_date 
-                    FROM stock_prices 
-                    GROUP BY code
+                query = f"""
+                    WITH RECURSIVE codes(code) AS (
+                        SELECT MIN(code) FROM stock_prices
+                        UNION ALL
+                        SELECT (SELECT MIN(code) FROM stock_prices WHERE code > codes.code)
+                        FROM codes WHERE codes.code IS NOT NULL
+                    )
+                    SELECT code,
+                           (SELECT MAX(date) FROM stock_prices sp WHERE sp.code = codes.code) AS latest_date
+                    FROM codes
+                    WHERE code IS NOT NULL AND NOT {self._pending_condition('codes.code')}
                 """
                 df = pd.read_sql_query(query, conn)
                 return df
         except (sqlite3.Error, pd.io.sql.DatabaseError) as e:
             logging.error(f"获取所有股票的最新日期失败: {e}")
-            return pd.DataFrame(columns=['code', 'latest_date'])
\ No newline at end of file
+            return pd.DataFrame(columns=['code', 'latest_date'])
+
+    def get_stocks_with_latest_date(self) -> pd.DataFrame:
+        """获取股票基本信息表中的所有股票及其价格数据的最新日期
+        
+        每只股票的最新日期通过一次(code, date)主键查找得到，没有价格数据或尚有数据未同步到Parquet的股票latest_date为NULL。
+        
+        Returns:
+            DataFrame，包含code、name和latest_date三列
+        """
+        try:
+            with self.get_connection() as conn:
+                query = f"""
+                    SELECT si.code,
+                           si.name,
+                           CASE WHEN {self._pending_condition('si.code')} THEN NULL
+                                ELSE (SELECT MAX(sp.date) FROM stock_prices sp WHERE sp.code = si.code)
+                           END AS latest_date
+                    FROM stock_info si
+                """
+                df = pd.read_sql_query(query, conn)
+                return df
+        except (sqlite3.Error, pd.io.sql.DatabaseError) as e:
+            logging.error(f"获取股票列表及最新日期失败: {e}")
+            return pd.DataFrame(columns=['code', 'name', 'latest_date'])
@@ -5,13 +5,21 @@
 从akshare下载股票数据并保存到本地SQLite数据库
 """
 
+import asyncio
 import logging
 import argparse
 import os
-import time
-from database import StockDatabase
-from data_fetcher import DataFetcher
-from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from typing import TYPE_CHECKING, Optional
+
+from arg_types import non_negative_float, positive_float, positive_int
+
+# pandas、akshare等依赖导入较慢，在main()中解析完参数后再导入，--help和参数错误时可以立即退出
+if TYPE_CHECKING:
+    from database import StockDatabase
+    from data_fetcher import DataFetcher
 
 # 配置日志
 logging.basicConfig(
@@ -24,12 +32,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 每处理多少只股票将缓冲的数据批量写入一次数据库
+FLUSH_EVERY = 100
+
+
+@dataclass(frozen=True, slots=True)
+class RunConfig:
+    """一次运行的配置，由命令行参数转换而来，创建后不可修改"""
+    db_path: str
+    parquet_dir: Optional[str]
+    stock_limit: int
+    price_period: str
+    max_retries: int
+    retry_backoff_base: float
+    retry_backoff_cap: float
+    concurrency: int
+    rate_limit_rps: float
+    refresh_stock_list: bool
+    watch_interval: Optional[float]
+    debug: bool
+
 
 def parse_arguments():
     """解析命令行参数"""
     parser = argparse.ArgumentParser(description='股票数据下载和更新工具')
     parser.add_argument('--db-path', type=str, default='stock_data.db',
                         help='SQLite数据库文件路径')
+    parser.add_argument('--parquet-dir', type=str, default=None,
+                        help='Parquet价格存储目录，设置后价格数据同时写入Parquet')
     parser.add_argument('--stock-limit', type=int, default=10,
                         help='要更新的股票数量限制，默认为10只')
     parser.add_argument('--price-period', type=str, default='1year',
@@ -37,15 +67,26 @@ def parse_arguments():
                         help='价格数据的时间周期')
     parser.add_argument('--max-retries', type=int, default=3,
                         help='网络请求失败后的最大重试次数')
-    parser.add_argument('--retry-delay', type=int, default=5,
-                        help='重试之间的延迟时间（秒）')
+    parser.add_argument('--retry-backoff-base', type=non_negative_float, default=0.5,
+                        help='重试的初始退避时间（秒），之后每次重试翻倍并加入随机抖动')
+    parser.add_argument('--retry-backoff-cap', type=non_negative_float, default=30,
+                        help='重试退避时间的上限（秒）')
+    parser.add_argument('--concurrency', type=positive_int, default=16,
+                        help='同时下载的股票数，也是执行阻塞网络请求的线程数')
+    parser.add_argument('--rate-limit-rps', type=positive_float, default=5,
+                        help='每秒最多发起的网络请求数，所有并发请求共享')
+    parser.add_argument('--refresh-stock-list', action='store_true',
+                        help='忽略本地缓存，强制从网络重新获取股票列表')
+    parser.add_argument('--watch-interval', type=positive_float, default=None,
+                        help='常驻运行，每隔指定秒数重新下载一轮；不设置时只运行一次。'
+                             '之后的每轮都会重新获取股票列表和价格数据，概念数据每天只更新一次')
     parser.add_argument('--debug', action='store_true',
                         help='启用调试日志模式')
     return parser.parse_args()
 
 
-def setup_environment(args):
-    """设置运行环境"""
+def setup_environment(args) -> RunConfig:
+    """设置运行环境，返回由命令行参数转换得到的运行配置"""
     # 如果启用了调试模式，设置日志级别为DEBUG
     if args.debug:
         for handler in logging.root.handlers:
@@ -59,77 +100,84 @@ def setup_environment(args):
         os.makedirs(db_dir)
         logger.info(f"创建数据库目录: {db_dir}")
     
-    return args
+    return RunConfig(**vars(args))
+
+
+async def download_once(config: RunConfig, db: "StockDatabase", fetcher: "DataFetcher", refresh: bool = False):
+    """执行一轮下载：获取股票列表，并发下载各股票的价格和概念数据并批量保存
+    
+    refresh为True时跳过当天的股票列表缓存和价格缓存，用于常驻运行时的后续各轮，否则同一天内的各轮下载不到新数据。
+    """
+    import pandas as pd
+    from database import STOCK_INFO_COLUMNS
+    
+    # 下载股票列表
+    logger.info("开始下载股票列表...")
+    # 限制股票数量时只取前stock_limit只股票
+    stock_rows = list(islice(fetcher.iter_stock_list(refresh=config.refresh_stock_list or refresh),
+                             config.stock_limit if config.stock_limit > 0 else None))
+    
+    if stock_rows:
+        if config.stock_limit > 0:
+            logger.info(f"限制处理 {config.stock_limit} 只股票")
+        
+        # 保存股票列表
+        db.save_stock_info(pd.DataFrame(stock_rows, columns=STOCK_INFO_COLUMNS))
+        
+        # 并发下载每只股票的价格数据和概念数据，信号量已限制请求并发，无需在股票之间休眠
+        logger.info("开始下载股票价格数据...")
+        
+        jobs = [(code, name if pd.notna(name) else "未知", config.price_period) for code, name, *_ in stock_rows]
+        # 所有股票的保存在同一个事务中完成，结束时只提交一次
+        with db.bulk_transaction():
+            success_count, fail_count = await fetcher.download_details(
+                jobs, config.concurrency, flush_every=FLUSH_EVERY, use_cache=not refresh)
+        
+        logger.info(f"数据下载完成 - 成功: {success_count}, 失败: {fail_count}")
+        logger.info("=== 股票数据下载系统运行完毕 ===")
+    else:
+        logger.warning("未获取到股票列表，无法继续下载数据")
 
 
-def main():
+async def main():
     """主函数，执行数据下载和保存操作"""
     try:
-        # 解析命令行参数
-        args = parse_arguments()
+        # 解析命令行参数并设置运行环境
+        config = setup_environment(parse_arguments())
         
-        # 设置运行环境
-        setup_environment(args)
+        from database import StockDatabase
+        from data_fetcher import DataFetcher, TokenBucket
         
         logger.info("=== 股票数据下载系统启动 ===")
         
         # 创建数据库实例
-        db = StockDatabase(args.db_path)
+        db = StockDatabase(config.db_path, parquet_dir=config.parquet_dir)
         
-        # 创建数据获取实例
-        fetcher = DataFetcher(db, max_retries=args.max_retries, retry_delay=args.retry_delay)
+        # 创建数据获取实例，所有并发请求共享同一个令牌桶进行全局速率限制
+        fetcher = DataFetcher(db, max_retries=config.max_retries, backoff_base=config.retry_backoff_base,
+                              backoff_cap=config.retry_backoff_cap,
+                              rate_limiter=TokenBucket(config.rate_limit_rps, capacity=config.concurrency))
         
-        # 下载股票列表
-        logger.info("开始下载股票列表...")
-        stock_list = fetcher.fetch_stock_list()
+        # akshare只提供阻塞接口，在线程池中执行；每只股票同时进行价格和概念两项请求，线程数取并发数的两倍
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=config.concurrency * 2))
         
-        if not stock_list.empty:
-            # 限制股票数量
-            if args.stock_limit > 0:
-                stock_list = stock_list.head(args.stock_limit)
-                logger.info(f"限制处理 {args.stock_limit} 只股票")
-            
-            # 保存股票列表
-            db.save_stock_info(stock_list)
-            
-            # 下载每只股票的价格数据和概念数据
-            logger.info("开始下载股票价格数据...")
-            
-            # 创建进度条
-            success_count = 0
-            fail_count = 0
-            
-            for index, row in tqdm(stock_list.iterrows(), total=len(stock_list), desc="处理股票数据"):
-                code = row['code']
-                name = row['name'] if 'name' in row else "未知"
-                
+        # 常驻运行时复用同一个数据库连接、数据获取器及其缓存和限流状态，每隔watch_interval秒下载一轮；
+        # 某一轮出错只记录日志，等待后继续下一轮
+        try:
+            if not config.watch_interval:
+                await download_once(config, db, fetcher)
+                return
+            rounds = 0
+            while True:
                 try:
-                    logger.debug(f"处理股票: {code} - {name}")
-                    
-                    # 下载价格数据
-                    price_data = fetcher.fetch_stock_prices(code, period=args.price_period)
-                    if not price_data.empty:
-                        db.save_stock_prices(price_data)
-                    
-                    # 下载概念数据
-                    concept_data = fetcher.fetch_stock_concepts(code)
-                    if not concept_data.empty:
-                        db.save_stock_concepts(concept_data)
-                    
-                    success_count += 1
-                    
-                    # 避免请求过于频繁
-                    time.sleep(1)
-                    
-                except Exception as e:
-                    logger.error(f"处理股票 {code} - {name} 失败: {e}")
-                    fail_count += 1
-                    continue
-            
-            logger.info(f"数据下载完成 - 成功: {success_count}, 失败: {fail_count}")
-            logger.info("=== 股票数据下载系统运行完毕 ===")
-        else:
-            logger.warning("未获取到股票列表，无法继续下载数据")
+                    await download_once(config, db, fetcher, refresh=rounds > 0)
+                except Exception:
+                    logger.exception(f"第 {rounds + 1} 轮下载失败")
+                rounds += 1
+                logger.info(f"{config.watch_interval} 秒后开始下一轮下载")
+                await asyncio.sleep(config.watch_interval)
+        finally:
+            db.close()
             
     except Exception as e:
         logger.error(f"系统运行出错: {e}")
@@ -137,4 +185,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("股票数据下载系统已停止")
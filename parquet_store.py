@@ -0,0 +1,102 @@
+# parquet_store.py
+import logging
+import os
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from database import PRICE_COLUMNS
+
+# 价格数据按股票代码和年份分区，目录结构为 code=XXXXXX/year=YYYY/，
+# 分区目录内的数据文件只包含以下列，股票代码和年份由目录名给出。
+# 人民币计价的开高低收价格用float32足够（约7位有效数字），成交量为整数股数；
+# 成交额可达百亿级，float32会丢失元以下甚至万元级精度，保留float64
+PRICE_SCHEMA = pa.schema([
+    ('date', pa.string()),
+    ('open', pa.float32()),
+    ('high', pa.float32()),
+    ('low', pa.float32()),
+    ('close', pa.float32()),
+    ('volume', pa.int64()),
+    ('amount', pa.float64()),
+])
+
+# 每个分区合并后的数据文件名；旧版本每次写入追加的文件名为part-<纳秒时间戳>-0.parquet，
+# 该文件名的字典序排在它们之后，合并中断时读取到的重复日期仍以合并后的数据为准
+PARTITION_FILE = 'prices.parquet'
+
+
+class ParquetStore:
+    """按(code, year)分区的Parquet价格数据存储
+
+    价格数据是只追加的时间序列，列式存储比SQLite行存储更紧凑，按列读取和过滤也更快。
+    每个分区只保存一个文件，写入时把新数据与该分区已有的数据合并后整体改写，
+    增量更新不会让分区内的小文件越积越多；同一日期被多次写入时以最后写入的数据为准。
+    """
+
+    def __init__(self, base_dir: str = "data/prices"):
+        self.base_dir = base_dir
+
+    def save_prices(self, price_data: pd.DataFrame):
+        """保存价格数据，price_data需包含PRICE_COLUMNS中的列
+
+        逐个改写涉及到的(code, year)分区，已有日期的数据被新数据覆盖。
+        """
+        if price_data.empty:
+            return
+
+        # 成交量转为int64前先取整，避免复权等计算产生的小数导致类型转换失败；NaN会转为null
+        data = price_data[PRICE_COLUMNS].assign(
+            volume=price_data['volume'].round(),
+            year=price_data['date'].str[:4],
+        )
+        for (code, year), rows in data.groupby(['code', 'year'], sort=False):
+            self._rewrite_partition(code, year, rows[PRICE_SCHEMA.names])
+        logging.info(f"已保存 {len(price_data)} 条价格数据到Parquet存储")
+
+    def _rewrite_partition(self, code: str, year: str, rows: pd.DataFrame):
+        """将新数据与分区中已有的数据合并去重后写成一个文件，替换分区中原有的文件"""
+        partition_dir = os.path.join(self.base_dir, f"code={code}", f"year={year}")
+        os.makedirs(partition_dir, exist_ok=True)
+        old_files = sorted(name for name in os.listdir(partition_dir) if name.endswith('.parquet'))
+        if old_files:
+            existing = ds.dataset(partition_dir, format='parquet', schema=PRICE_SCHEMA).to_table().to_pandas()
+            rows = pd.concat([existing, rows], ignore_index=True)
+        rows = rows.drop_duplicates('date', keep='last').sort_values('date', ignore_index=True)
+
+        # 先写入以点开头的临时文件（读取时会被忽略），再原子替换，写入中断不会损坏已有数据；
+        # 旧文件的数据已包含在新文件中，替换后再删除
+        tmp_path = os.path.join(partition_dir, f".{PARTITION_FILE}.{os.getpid()}.tmp")
+        pq.write_table(pa.Table.from_pandas(rows, schema=PRICE_SCHEMA, preserve_index=False), tmp_path)
+        os.replace(tmp_path, os.path.join(partition_dir, PARTITION_FILE))
+        for name in old_files:
+            if name != PARTITION_FILE:
+                os.remove(os.path.join(partition_dir, name))
+
+    def get_prices(self, code: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> pd.DataFrame:
+        """读取指定股票的价格数据
+
+        只扫描该股票自己的分区目录，日期条件下推到Parquet文件的行组统计信息上过滤。
+        """
+        code_dir = os.path.join(self.base_dir, f"code={code}")
+        if not os.path.isdir(code_dir):
+            return pd.DataFrame(columns=PRICE_COLUMNS)
+
+        dataset = ds.dataset(code_dir, format='parquet', schema=PRICE_SCHEMA)
+        condition = None
+        if start_date:
+            condition = pc.field('date') >= start_date
+        if end_date:
+            end_condition = pc.field('date') <= end_date
+            condition = end_condition if condition is None else condition & end_condition
+
+        df = dataset.to_table(columns=PRICE_SCHEMA.names, filter=condition).to_pandas()
+
+        # 旧版本写入的分区或合并中断时同一日期可能出现在多个文件中，保留最后写入的一条
+        df = df.drop_duplicates('date', keep='last').sort_values('date', ignore_index=True)
+        df.insert(0, 'code', code)
+        return df
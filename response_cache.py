@@ -0,0 +1,99 @@
+# response_cache.py
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional
+
+# 缓存条目的最长保留时间（秒），超过后在打开缓存时清理
+MAX_AGE = 7 * 24 * 60 * 60
+
+
+class ResponseCache:
+    """基于SQLite的网络请求结果缓存
+
+    结果以pickle序列化后按键保存，读取时按调用方给定的有效期判断是否过期；
+    使用独立的数据库文件，不与股票数据库争用写锁。
+    """
+
+    def __init__(self, path: str = os.path.join('.cache', 'responses.db')):
+        self.path = path
+        # sqlite3连接不能跨线程共享，每个线程各自持有一个长连接
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    ts INTEGER,
+                    blob BLOB
+                )
+            ''')
+            conn.execute("DELETE FROM response_cache WHERE ts < ?", (int(time.time()) - MAX_AGE,))
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # 多个线程同时写入时等待锁释放，而不是立即报错
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _key(namespace: str, parts: tuple) -> str:
+        return hashlib.blake2b(repr((namespace, *parts)).encode(), digest_size=16).hexdigest()
+
+    def get(self, namespace: str, parts: tuple, ttl: float) -> Optional[Any]:
+        """读取ttl秒内缓存的结果，未命中、已过期或无法读取时返回None"""
+        key = self._key(namespace, parts)
+        try:
+            row = self._connection().execute(
+                "SELECT blob FROM response_cache WHERE key = ? AND ts > ?",
+                (key, int(time.time() - ttl)),
+            ).fetchone()
+            return pickle.loads(row[0]) if row else None
+        except Exception as e:
+            # 反序列化可能抛出任意异常（数据损坏、依赖库版本变化等），一律按未命中处理并删除该条目
+            logging.warning(f"读取响应缓存失败: {e}")
+            self._delete(key)
+            return None
+
+    def _delete(self, key: str):
+        try:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logging.warning(f"删除响应缓存失败: {e}")
+
+    def set(self, namespace: str, parts: tuple, value: Any):
+        """保存结果，缓存写入失败不影响调用方"""
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, ts, blob) VALUES (?, ?, ?)",
+                    (self._key(namespace, parts), int(time.time()),
+                     pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)),
+                )
+        except sqlite3.Error as e:
+            logging.warning(f"写入响应缓存失败: {e}")
+
+    def get_or_fetch(self, namespace: str, parts: tuple, ttl: float, fetch: Callable[[], Any]) -> Any:
+        """缓存命中时直接返回，否则调用fetch获取并写入缓存"""
+        result = self.get(namespace, parts, ttl)
+        if result is not None:
+            logging.debug(f"响应缓存命中: {namespace} {parts}")
+            return result
+        result = fetch()
+        self.set(namespace, parts, result)
+        return result
+
+    def close(self):
+        """关闭当前线程的缓存连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None